@@ -2,17 +2,25 @@
 # ---------------------------------------------------------
 # IMPORTS
 # ---------------------------------------------------------
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from flask_login import LoginManager, login_user, login_required, logout_user, current_user
+from flask import Flask, Response, abort, render_template, request, redirect, url_for, flash, jsonify, stream_with_context
+from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from models import db, User, Stock, Alert
+from models import db, User, Instrument, Stock, Alert, AlertTrigger, PriceHistory
+from upstream import StaleWhileRevalidate, UpstreamError, YAHOO_QUOTES, YAHOO_NEWS, GOOGLE_NEWS
+from migrate import migrate_to_instruments, seed_instruments
 import requests 
 import yfinance as yf 
+import csv
+import io
 import json
 import os
 import time # Needed for caching
 import feedparser
 import urllib.parse
+from datetime import date
+from sqlalchemy import select, text
+from sqlalchemy.orm import joinedload
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
 
 # ---------------------------------------------------------
 # CONFIGURATION
@@ -28,16 +36,65 @@ login_manager = LoginManager()
 login_manager.login_view = 'login'
 login_manager.init_app(app)
 
+# ---------------------------------------------------------
+# AUTH CACHE (Keeps the 2s polling routes off the user table)
+# ---------------------------------------------------------
+USER_CACHE = {} # user_id -> (CachedUser, timestamp)
+USER_CACHE_TTL = 30 # Seconds. Bounds staleness across worker processes
+
+class CachedUser(UserMixin):
+    """Detached, read-only copy of the fields routes need from User.
+    Writes must go through User.query.get(current_user.id)."""
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.telegram_chat_id = user.telegram_chat_id
+
+def invalidate_user(user_id):
+    """Drops a user from the auth cache. Call after any User write."""
+    USER_CACHE.pop(int(user_id), None)
+
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    user_id = int(id)
+    cached = USER_CACHE.get(user_id)
+    if cached and time.time() - cached[1] < USER_CACHE_TTL:
+        return cached[0]
+
+    user = User.query.get(user_id)
+    if user is None:
+        invalidate_user(user_id)
+        return None
+    identity = CachedUser(user)
+    USER_CACHE[user_id] = (identity, time.time())
+    return identity
 
 # ---------------------------------------------------------
 # GLOBAL CACHES
 # ---------------------------------------------------------
 MARKET_LIST = []
-STOCK_DETAILS_CACHE = {} # Stores deep dive data
-CACHE_DURATION = 300 # 5 Minutes cache for stock details
+DETAILS_CACHE_TTL = 60 # 1 Minute for deep dive data ("Live" feel)
+NEWS_CACHE_TTL = 300 # 5 Minutes for news per symbol
+
+# ---------------------------------------------------------
+# UPSTREAM POOL (Yahoo / Google / Telegram)
+# ---------------------------------------------------------
+# Slow upstreams run here, NOT in the request thread directly.
+# Pool is bounded so a Yahoo outage can't eat every worker,
+# and the 2s polling routes (stats/rows) never touch it.
+UPSTREAM_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix='upstream')
+UPSTREAM_TIMEOUT = 8   # Max seconds a route waits on one upstream call
+HTTP_TIMEOUT = 5       # Socket timeout for raw HTTP calls (RSS, Telegram)
+
+def run_upstream(fn, *args, timeout=UPSTREAM_TIMEOUT):
+    """Runs fn on the upstream pool and waits at most `timeout` seconds.
+    Raises concurrent.futures.TimeoutError if the upstream is too slow."""
+    future = UPSTREAM_POOL.submit(fn, *args)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel() # Drops it if still queued; running calls finish in background
+        raise
 
 def load_market_data():
     """Loads the FULL NSE Master List from local JSON on startup."""
@@ -58,43 +115,65 @@ def load_market_data():
 
 # Load data when app starts
 with app.app_context():
+    # Migrate FIRST: create_all would otherwise add alert_trigger pointing at
+    # the old `alert` table, and the rename would drag its FK to alert_legacy
+    migrate_to_instruments(db.engine)
     db.create_all()
-    from sqlalchemy import text
     with db.engine.connect() as con:
         con.execute(text("PRAGMA journal_mode=WAL;"))
     
     load_market_data()
+    seed_instruments(MARKET_LIST)
 
 # ---------------------------------------------------------
 # HELPER FUNCTIONS
 # ---------------------------------------------------------
+def get_or_create_instrument(symbol):
+    """Returns the Instrument for symbol, adding it if it's not in the master list."""
+    instrument = Instrument.query.filter_by(symbol=symbol).first()
+    if instrument is None:
+        # OR IGNORE: a concurrent request may have added the same symbol
+        db.session.execute(text("""
+            INSERT OR IGNORE INTO instrument (symbol, current_price, previous_close)
+            VALUES (:symbol, 0.0, 0.0)
+        """), {'symbol': symbol})
+        instrument = Instrument.query.filter_by(symbol=symbol).one()
+    return instrument
+
+def calc_holding(quantity, buy_price, current_price, previous_close):
+    """P&L for one holding. Falls back to buy price until monitor.py has a quote."""
+    live_price = current_price if current_price > 0 else buy_price
+    prev_close = previous_close if previous_close > 0 else buy_price 
+    
+    val = live_price * quantity
+    cost = buy_price * quantity
+    
+    pnl = val - cost
+    pnl_pct = (pnl / cost * 100) if cost > 0 else 0
+    
+    day_change = (live_price - prev_close) * quantity
+    return live_price, prev_close, cost, val, pnl, pnl_pct, day_change
+
 def get_portfolio_data(user_id):
     """Calculates detailed portfolio stats including Daily P&L."""
-    stocks = Stock.query.filter_by(user_id=user_id).all()
+    stocks = Stock.query.filter_by(user_id=user_id).options(joinedload(Stock.instrument)).all()
     data = []
     total_invested = 0
     current_value = 0
     daily_pnl = 0 
     
     for s in stocks:
-        live_price = s.current_price if s.current_price > 0 else s.buy_price
-        prev_close = s.previous_close if s.previous_close > 0 else s.buy_price 
-        
-        val = live_price * s.quantity
-        cost = s.buy_price * s.quantity
-        
-        pnl = val - cost
-        pnl_pct = (pnl / cost * 100) if cost > 0 else 0
+        quote = s.instrument
+        live_price, _, cost, val, pnl, pnl_pct, day_change = calc_holding(
+            s.quantity, s.buy_price, quote.current_price, quote.previous_close)
         
-        day_change = (live_price - prev_close) * s.quantity
         daily_pnl += day_change
-        
         total_invested += cost
         current_value += val
         
         data.append({
             'id': s.id,
-            'symbol': s.symbol,
+            'symbol': quote.symbol,
             'qty': s.quantity,
             'buy': s.buy_price,
             'price': round(live_price, 2),
@@ -104,6 +183,221 @@ def get_portfolio_data(user_id):
         
     return data, round(total_invested, 2), round(current_value, 2), round(daily_pnl, 2)
 
+# ---------------------------------------------------------
+# EXPORTS (Row generators + streaming writer)
+# ---------------------------------------------------------
+# Rows are pulled from the DB in batches (yield_per) and written out in
+# chunks, so export size doesn't affect worker memory.
+EXPORT_BATCH = 1000
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+def stream_rows(stmt):
+    return db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH))
+
+def export_holdings(user_id, args):
+    columns = ['id', 'symbol', 'qty', 'buy', 'price', 'prev_close', 'invested', 'value', 'pnl', 'pnl_pct', 'day_change']
+    stmt = (select(Stock.id, Instrument.symbol, Stock.quantity, Stock.buy_price,
+                   Instrument.current_price, Instrument.previous_close)
+            .join(Stock.instrument)
+            .where(Stock.user_id == user_id)
+            .order_by(Stock.id))
+
+    def rows():
+        for s_id, symbol, qty, buy, current, prev in stream_rows(stmt):
+            live_price, prev_close, cost, val, pnl, pnl_pct, day_change = calc_holding(qty, buy, current, prev)
+            yield (s_id, symbol, qty, buy, round(live_price, 2), round(prev_close, 2), round(cost, 2), round(val, 2),
+                   round(pnl, 2), round(pnl_pct, 2), round(day_change, 2))
+    return columns, rows()
+
+def export_alerts(user_id, args):
+    """One row per trigger; alerts that never fired get one row with empty trigger columns."""
+    columns = ['alert_id', 'symbol', 'condition', 'target_price', 'is_active', 'triggered_at', 'trigger_price']
+    stmt = (select(Alert.id, Instrument.symbol, Alert.condition, Alert.target_price, Alert.is_active,
+                   AlertTrigger.triggered_at, AlertTrigger.price)
+            .join(Alert.instrument)
+            .outerjoin(AlertTrigger, AlertTrigger.alert_id == Alert.id)
+            .where(Alert.user_id == user_id)
+            .order_by(Alert.id, AlertTrigger.triggered_at))
+    return columns, (tuple(r) for r in stream_rows(stmt))
+
+def export_prices(user_id, args):
+    """Daily closes. Defaults to the user's holdings + alerts; ?symbols=A,B
+    picks any tracked symbols. ?start= / ?end= take YYYY-MM-DD."""
+    columns = ['symbol', 'day', 'close']
+    stmt = (select(Instrument.symbol, PriceHistory.day, PriceHistory.close)
+            .join(Instrument, Instrument.id == PriceHistory.instrument_id)
+            .order_by(PriceHistory.instrument_id, PriceHistory.day))
+
+    symbols = [s.strip().upper() for s in args.get('symbols', '').split(',') if s.strip()]
+    if symbols:
+        stmt = stmt.where(Instrument.symbol.in_(symbols))
+    else:
+        mine = (select(Stock.instrument_id).where(Stock.user_id == user_id)
+                .union(select(Alert.instrument_id).where(Alert.user_id == user_id)))
+        stmt = stmt.where(PriceHistory.instrument_id.in_(mine))
+
+    try:
+        if args.get('start'):
+            stmt = stmt.where(PriceHistory.day >= date.fromisoformat(args['start']))
+        if args.get('end'):
+            stmt = stmt.where(PriceHistory.day <= date.fromisoformat(args['end']))
+    except ValueError:
+        abort(400)
+    return columns, (tuple(r) for r in stream_rows(stmt))
+
+EXPORTS = {
+    'holdings': export_holdings,
+    'alerts': export_alerts,
+    'prices': export_prices,
+}
+
+def stream_export(name, fmt, columns, rows):
+    """Wraps a row generator in a chunked download response."""
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if fmt == 'csv':
+            writer.writerow(columns)
+        for i, row in enumerate(rows, 1):
+            if fmt == 'csv':
+                writer.writerow(row)
+            else:
+                buf.write(json.dumps(dict(zip(columns, row)), default=str) + "\n")
+            if i % EXPORT_BATCH == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate(0)
+        yield buf.getvalue()
+
+    return Response(stream_with_context(generate()),
+                    mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename=narad_{name}.{fmt}'})
+
+# ---------------------------------------------------------
+# UPSTREAM FETCHERS (Run on UPSTREAM_POOL, no DB access here)
+# ---------------------------------------------------------
+def fetch_stock_details(symbol):
+    """Fetches quote info + intraday chart for the Deep Dive modal."""
+    ticker = yf.Ticker(symbol)
+    info = YAHOO_QUOTES.call(lambda: ticker.info)
+    
+    # Fetch 1 Day of data with 5-minute intervals
+    history = YAHOO_QUOTES.call(ticker.history, period="1d", interval="5m")
+    
+    # Fallback for weekends/holidays: If today is empty, get last 5 days
+    if history.empty:
+        history = YAHOO_QUOTES.call(ticker.history, period="5d", interval="60m")
+
+    # Process Chart Data (Time Format: HH:MM)
+    # We convert to IST (approx) by just taking the string time from the index
+    chart_labels = [date.strftime('%H:%M') for date in history.index]
+    chart_prices = [round(price, 2) for price in history['Close'].tolist()]
+
+    details = {
+        "name": info.get('longName', symbol),
+        "symbol": symbol,
+        "sector": info.get('sector', 'Equity'),
+        "current_price": info.get('currentPrice', info.get('regularMarketPrice', 0)),
+        
+        # Ranges
+        "day_high": info.get('dayHigh', 0),
+        "day_low": info.get('dayLow', 0),
+        "prev_close": info.get('previousClose', 0),
+        "volume": info.get('volume', 0),
+        "year_high": info.get('fiftyTwoWeekHigh', 0),
+        "year_low": info.get('fiftyTwoWeekLow', 0),
+        
+        # Valuation
+        "market_cap": info.get('marketCap', 0),
+        "pe_ratio": info.get('trailingPE', 0),
+        "dividend_yield": info.get('dividendYield', 0) * 100 if info.get('dividendYield') else 0,
+        
+        # INTRADAY CHART DATA
+        "chart_labels": chart_labels,
+        "chart_prices": chart_prices
+    }
+    
+    # Format Market Cap
+    mc = details['market_cap']
+    if mc > 10**12: details['fmt_market_cap'] = f"₹{round(mc/10**12, 2)}T"
+    elif mc > 10**7: details['fmt_market_cap'] = f"₹{round(mc/10**7, 2)} Cr"
+    else: details['fmt_market_cap'] = f"₹{mc}"
+
+    return details
+
+def fetch_rss(url):
+    """Downloads with a timeout first (feedparser itself never times out)."""
+    resp = requests.get(url, timeout=HTTP_TIMEOUT)
+    resp.raise_for_status() # 429/5xx count as failures for the breaker
+    return feedparser.parse(resp.content)
+
+def time_ago(timestamp):
+    time_diff = int(time.time() - timestamp)
+    if time_diff < 3600: return f"{int(time_diff/60)}m ago"
+    elif time_diff < 86400: return f"{int(time_diff/3600)}h ago"
+    else: return f"{int(time_diff/86400)}d ago"
+
+def fetch_symbol_news(symbol):
+    """Returns the top 2 news items for one symbol (Google RSS, Yahoo fallback).
+    Raises if both fail, so the cache keeps the last good items."""
+    news = []
+    # CLEAN SYMBOL: Remove .NS for better Google News results
+    clean_symbol = symbol.replace('.NS', '').replace('.BO', '')
+    
+    # --- STRATEGY A: Google News RSS (More Reliable for India) ---
+    try:
+        # We search for "Stock Name + Share Price" to get financial news
+        query = urllib.parse.quote(f"{clean_symbol} share news india")
+        rss_url = f"https://news.google.com/rss/search?q={query}&hl=en-IN&gl=IN&ceid=IN:en"
+        
+        feed = GOOGLE_NEWS.call(fetch_rss, rss_url)
+        
+        for entry in feed.entries[:2]: # Get top 2
+            # Google RSS doesn't give images easily, so we use a fallback icon
+            published_parsed = entry.published_parsed
+            timestamp = time.mktime(published_parsed) if published_parsed else time.time()
+
+            news.append({
+                'symbol': symbol,
+                'title': entry.title,
+                'publisher': entry.source.title if hasattr(entry, 'source') else 'Google News',
+                'link': entry.link,
+                'time': None, # Filled at render time (items may come from cache)
+                'timestamp': timestamp,
+                'thumbnail': None # We will handle None in template
+            })
+            
+    except Exception as e:
+        print(f"RSS Failed for {symbol}: {e}")
+        
+        # --- STRATEGY B: Fallback to Yahoo Finance (If RSS fails) ---
+        news_items = YAHOO_NEWS.call(lambda: yf.Ticker(symbol).news)
+        for item in news_items[:2]:
+            publish_time = item.get('providerPublishTime', 0)
+            news.append({
+                'symbol': symbol,
+                'title': item.get('title'),
+                'publisher': item.get('publisher'),
+                'link': item.get('link'),
+                'time': "Recent",
+                'timestamp': publish_time,
+                'thumbnail': item.get('thumbnail', {}).get('resolutions', [{}])[0].get('url')
+            })
+
+    return news
+
+def fetch_last_close(symbol):
+    """Latest close from Yahoo (used when we don't track the stock yet)."""
+    data = YAHOO_QUOTES.call(yf.Ticker(symbol).history, period="1d")
+    if data.empty:
+        return 0
+    return data['Close'].iloc[-1]
+
+# Stale-while-revalidate over the fetchers above: callers get the last
+# good value instantly, one background refresh runs per stale key.
+DETAILS_CACHE = StaleWhileRevalidate(fetch_stock_details, DETAILS_CACHE_TTL, UPSTREAM_POOL)
+NEWS_CACHE = StaleWhileRevalidate(fetch_symbol_news, NEWS_CACHE_TTL, UPSTREAM_POOL)
+
 # ---------------------------------------------------------
 # ROUTES: DASHBOARD & HTMX
 # ---------------------------------------------------------
@@ -139,76 +433,20 @@ def htmx_rows():
     data, _, _, _ = get_portfolio_data(current_user.id)
     return render_template('partials/stock_rows.html', stocks=data)
 
-# app.py (PARTIAL UPDATE - Replace the stock_details route)
-
 @app.route('/htmx/stock_details/<symbol>')
 @login_required
 def stock_details(symbol):
     try:
-        current_time = time.time()
-        
-        # 1. CHECK CACHE (Reduce duration to 60s for "Live" feel)
-        if symbol in STOCK_DETAILS_CACHE:
-            cached_entry = STOCK_DETAILS_CACHE[symbol]
-            if current_time - cached_entry['timestamp'] < 60: # 1 Minute Cache
-                print(f"--- ⚡ Serving {symbol} from Cache ---")
-                return render_template('partials/stock_details_modal.html', stock=cached_entry['data'])
-
-        # 2. FETCH LIVE INTRADAY DATA
-        print(f"--- 📡 Fetching Intraday data for {symbol}... ---")
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
-        
-        # Fetch 1 Day of data with 5-minute intervals
-        history = ticker.history(period="1d", interval="5m")
-        
-        # Fallback for weekends/holidays: If today is empty, get last 5 days
-        if history.empty:
-            history = ticker.history(period="5d", interval="60m")
-
-        # Process Chart Data (Time Format: HH:MM)
-        # We convert to IST (approx) by just taking the string time from the index
-        chart_labels = [date.strftime('%H:%M') for date in history.index]
-        chart_prices = [round(price, 2) for price in history['Close'].tolist()]
-
-        details = {
-            "name": info.get('longName', symbol),
-            "symbol": symbol,
-            "sector": info.get('sector', 'Equity'),
-            "current_price": info.get('currentPrice', info.get('regularMarketPrice', 0)),
-            
-            # Ranges
-            "day_high": info.get('dayHigh', 0),
-            "day_low": info.get('dayLow', 0),
-            "prev_close": info.get('previousClose', 0),
-            "volume": info.get('volume', 0),
-            "year_high": info.get('fiftyTwoWeekHigh', 0),
-            "year_low": info.get('fiftyTwoWeekLow', 0),
-            
-            # Valuation
-            "market_cap": info.get('marketCap', 0),
-            "pe_ratio": info.get('trailingPE', 0),
-            "dividend_yield": info.get('dividendYield', 0) * 100 if info.get('dividendYield') else 0,
-            
-            # INTRADAY CHART DATA
-            "chart_labels": chart_labels,
-            "chart_prices": chart_prices
-        }
-        
-        # Format Market Cap
-        mc = details['market_cap']
-        if mc > 10**12: details['fmt_market_cap'] = f"₹{round(mc/10**12, 2)}T"
-        elif mc > 10**7: details['fmt_market_cap'] = f"₹{round(mc/10**7, 2)} Cr"
-        else: details['fmt_market_cap'] = f"₹{mc}"
-
-        # 3. SAVE TO CACHE
-        STOCK_DETAILS_CACHE[symbol] = {
-            "data": details,
-            "timestamp": current_time
-        }
-
+        # Cached (even stale) data returns at once; only a cold miss waits
+        details = DETAILS_CACHE.get(symbol, timeout=UPSTREAM_TIMEOUT)
         return render_template('partials/stock_details_modal.html', stock=details)
 
+    except FutureTimeout:
+        print(f"Details Timeout for {symbol}")
+        return f"<div class='p-8 text-center text-red-500 font-bold'>Market data is slow right now. Please try again later.</div>"
+    except UpstreamError as e:
+        print(f"Details Skipped for {symbol}: {e}")
+        return f"<div class='p-8 text-center text-red-500 font-bold'>Market data is busy right now. Please try again later.</div>"
     except Exception as e:
         print(f"Error fetching details: {e}")
         return f"<div class='p-8 text-center text-red-500 font-bold'>Error fetching data. Please try again later.</div>"
@@ -232,78 +470,35 @@ def chart_data():
 def portfolio_news():
     try:
         # 1. Get User's Stocks
-        stocks = Stock.query.filter_by(user_id=current_user.id).all()
+        stocks = Stock.query.filter_by(user_id=current_user.id).options(joinedload(Stock.instrument)).all()
         if not stocks:
             return "<div class='text-gray-400 text-sm text-center p-4'>Add stocks to see relevant news.</div>"
 
         # 2. Identify Top 3 Holdings
-        stocks.sort(key=lambda s: s.quantity * (s.current_price if s.current_price > 0 else s.buy_price), reverse=True)
-        top_stocks = stocks[:3] 
+        stocks.sort(key=lambda s: s.quantity * (s.instrument.current_price if s.instrument.current_price > 0 else s.buy_price), reverse=True)
+        top_symbols = [s.instrument.symbol for s in stocks[:3]]
 
-        all_news = []
-        print(f"--- 📰 Fetching News for: {[s.symbol for s in top_stocks]} ---")
+        print(f"--- 📰 Fetching News for: {top_symbols} ---")
 
-        for stock in top_stocks:
-            # CLEAN SYMBOL: Remove .NS for better Google News results
-            clean_symbol = stock.symbol.replace('.NS', '').replace('.BO', '')
-            
-            # --- STRATEGY A: Google News RSS (More Reliable for India) ---
+        # 3. Fan out: cached feeds return at once, misses load in parallel
+        futures = [NEWS_CACHE.get_future(sym) for sym in top_symbols]
+        done, _ = wait(futures, timeout=UPSTREAM_TIMEOUT)
+        # Left running on purpose: they fill the cache for the next request
+
+        all_news = []
+        for f in done:
             try:
-                # We search for "Stock Name + Share Price" to get financial news
-                query = urllib.parse.quote(f"{clean_symbol} share news india")
-                rss_url = f"https://news.google.com/rss/search?q={query}&hl=en-IN&gl=IN&ceid=IN:en"
-                
-                feed = feedparser.parse(rss_url)
-                
-                for entry in feed.entries[:2]: # Get top 2
-                    # Google RSS doesn't give images easily, so we use a fallback icon
-                    published_parsed = entry.published_parsed
-                    timestamp = time.mktime(published_parsed) if published_parsed else time.time()
-                    
-                    # Time formatting
-                    time_diff = int(time.time() - timestamp)
-                    if time_diff < 3600: time_str = f"{int(time_diff/60)}m ago"
-                    elif time_diff < 86400: time_str = f"{int(time_diff/3600)}h ago"
-                    else: time_str = f"{int(time_diff/86400)}d ago"
-
-                    all_news.append({
-                        'symbol': stock.symbol,
-                        'title': entry.title,
-                        'publisher': entry.source.title if hasattr(entry, 'source') else 'Google News',
-                        'link': entry.link,
-                        'time': time_str,
-                        'timestamp': timestamp,
-                        'thumbnail': None # We will handle None in template
-                    })
-                    
+                all_news.extend(f.result())
             except Exception as e:
-                print(f"RSS Failed for {stock.symbol}: {e}")
-                
-                # --- STRATEGY B: Fallback to Yahoo Finance (If RSS fails) ---
-                try:
-                    ticker = yf.Ticker(stock.symbol)
-                    news_items = ticker.news
-                    for item in news_items[:2]:
-                        publish_time = item.get('providerPublishTime', 0)
-                        all_news.append({
-                            'symbol': stock.symbol,
-                            'title': item.get('title'),
-                            'publisher': item.get('publisher'),
-                            'link': item.get('link'),
-                            'time': "Recent",
-                            'timestamp': publish_time,
-                            'thumbnail': item.get('thumbnail', {}).get('resolutions', [{}])[0].get('url')
-                        })
-                except:
-                    pass
-
-        # 3. Sort & Dedup
+                print(f"News Fetch Failed: {e}")
+
+        # 4. Sort & Dedup
         # Remove duplicates based on title
         seen_titles = set()
         unique_news = []
         for news in all_news:
             if news['title'] not in seen_titles:
-                unique_news.append(news)
+                unique_news.append(dict(news, time=news['time'] or time_ago(news['timestamp'])))
                 seen_titles.add(news['title'])
 
         unique_news.sort(key=lambda x: x['timestamp'], reverse=True)
@@ -313,6 +508,18 @@ def portfolio_news():
         print(f"News Error: {e}")
         return "<div class='text-red-400 text-sm p-4 text-center'>News feed temporarily unavailable.</div>"
 
+# ---------------------------------------------------------
+# ROUTES: EXPORTS
+# ---------------------------------------------------------
+@app.route('/api/export/<dataset>.<fmt>')
+@login_required
+def export_data(dataset, fmt):
+    """Streams holdings / alerts / prices as CSV or NDJSON."""
+    if dataset not in EXPORTS or fmt not in EXPORT_FORMATS:
+        abort(404)
+    columns, rows = EXPORTS[dataset](current_user.id, request.args)
+    return stream_export(dataset, fmt, columns, rows)
+
 # ---------------------------------------------------------
 # ROUTES: ACTIONS
 # ---------------------------------------------------------
@@ -324,11 +531,9 @@ def add_stock():
         symbol += '.NS'
     
     new_stock = Stock(
-        symbol=symbol, 
+        instrument=get_or_create_instrument(symbol), 
         buy_price=float(request.form.get('price')), 
         quantity=float(request.form.get('qty')),
-        current_price=0.0,      
-        previous_close=0.0,     
         user_id=current_user.id
     )
     db.session.add(new_stock)
@@ -341,9 +546,10 @@ def add_stock():
 def delete_stock(stock_id):
     stock = Stock.query.get_or_404(stock_id)
     if stock.user_id == current_user.id:
+        symbol = stock.instrument.symbol # Read before commit detaches the row
         db.session.delete(stock)
         db.session.commit()
-        flash(f"Removed {stock.symbol}")
+        flash(f"Removed {symbol}")
     return redirect(url_for('dashboard'))
 
 @app.route('/set_alert', methods=['POST'])
@@ -358,16 +564,16 @@ def set_alert():
     manual_condition = request.form.get('condition')
     
     current_price = 0
-    stock = Stock.query.filter_by(user_id=current_user.id, symbol=symbol).first()
+    # Plain SELECT only: no write lock may be held while we wait on Yahoo below,
+    # or monitor.py and every other writer stall behind the upstream call
+    instrument = Instrument.query.filter_by(symbol=symbol).first()
     
-    if stock and stock.current_price > 0:
-        current_price = stock.current_price
+    # Live quote is shared, so any user holding this symbol gives us a price
+    if instrument and instrument.current_price > 0:
+        current_price = instrument.current_price
     else:
         try:
-            ticker = yf.Ticker(symbol)
-            data = ticker.history(period="1d")
-            if not data.empty:
-                current_price = data['Close'].iloc[-1]
+            current_price = run_upstream(fetch_last_close, symbol)
         except:
             current_price = target 
 
@@ -378,7 +584,10 @@ def set_alert():
     else:
         condition = manual_condition
     
-    new_alert = Alert(symbol=symbol, target_price=target, condition=condition, user_id=current_user.id)
+    # Writes start here and commit straight away
+    if instrument is None:
+        instrument = get_or_create_instrument(symbol)
+    new_alert = Alert(instrument=instrument, target_price=target, condition=condition, user_id=current_user.id)
     db.session.add(new_alert)
     db.session.commit()
     
@@ -390,6 +599,7 @@ def set_alert():
 def delete_alert(alert_id):
     alert = Alert.query.get_or_404(alert_id)
     if alert.user_id == current_user.id:
+        AlertTrigger.query.filter_by(alert_id=alert.id).delete()
         db.session.delete(alert)
         db.session.commit()
     return redirect(url_for('alerts_page'))
@@ -400,8 +610,10 @@ def delete_alert(alert_id):
 @app.route('/update_telegram', methods=['POST'])
 @login_required
 def update_telegram():
-    current_user.telegram_chat_id = request.form.get('chat_id')
+    user = User.query.get(current_user.id)
+    user.telegram_chat_id = request.form.get('chat_id')
     db.session.commit()
+    invalidate_user(user.id)
     flash("Telegram ID Updated")
     return redirect(url_for('settings_page'))
 
@@ -415,7 +627,7 @@ def test_telegram():
         return redirect(url_for('settings_page'))
     url = f"https://api.telegram.org/bot{token}/sendMessage"
     try:
-        resp = requests.post(url, json={"chat_id": chat_id, "text": "🔔 Narad Muni here! Connection Successful."})
+        resp = requests.post(url, json={"chat_id": chat_id, "text": "🔔 Narad Muni here! Connection Successful."}, timeout=HTTP_TIMEOUT)
         if resp.status_code == 200:
             flash("Message sent! Check your Telegram.")
         else:
@@ -429,9 +641,12 @@ def test_telegram():
 def delete_account():
     user = User.query.get(current_user.id)
     Stock.query.filter_by(user_id=user.id).delete()
+    alert_ids = select(Alert.id).where(Alert.user_id == user.id)
+    AlertTrigger.query.filter(AlertTrigger.alert_id.in_(alert_ids)).delete(synchronize_session=False)
     Alert.query.filter_by(user_id=user.id).delete()
     db.session.delete(user)
     db.session.commit()
+    invalidate_user(user.id)
     logout_user()
     return redirect(url_for('login'))
 
@@ -441,7 +656,7 @@ def delete_account():
 @app.route('/alerts')
 @login_required
 def alerts_page():
-    user_alerts = Alert.query.filter_by(user_id=current_user.id).all()
+    user_alerts = Alert.query.filter_by(user_id=current_user.id).options(joinedload(Alert.instrument)).all()
     return render_template('alerts.html', alerts=user_alerts)
 
 @app.route('/settings')
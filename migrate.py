@@ -0,0 +1,77 @@
+# migrate.py (SCHEMA UPGRADES FOR EXISTING DATABASES)
+# Run automatically by app.py on startup, or by hand:
+#   python migrate.py
+from sqlalchemy import inspect, text
+from models import db, Instrument, Stock, Alert
+
+def migrate_to_instruments(engine):
+    """Moves free-text stock/alert symbols onto the shared `instrument` table.
+
+    Old DBs store `symbol` + live prices on every `stock` row. We rename the
+    old tables, create the new ones from the models, copy rows across
+    (one instrument per distinct symbol, keeping the freshest quote), then
+    drop the old tables. Safe to call on every startup: it does nothing once
+    `stock.symbol` is gone.
+    """
+    insp = inspect(engine)
+    if 'stock' not in insp.get_table_names():
+        return False
+    if 'symbol' not in [c['name'] for c in insp.get_columns('stock')]:
+        return False
+
+    print("--- 🔧 Migrating holdings & alerts to instrument table... ---")
+    # ONE transaction for rename + create + copy + drop: if anything fails
+    # the old tables come back untouched and the next startup retries.
+    with engine.begin() as con:
+        # pysqlite only opens transactions for DML; DDL would autocommit
+        con.exec_driver_sql("BEGIN")
+        con.execute(text("ALTER TABLE stock RENAME TO stock_legacy"))
+        con.execute(text("ALTER TABLE alert RENAME TO alert_legacy"))
+
+        db.metadata.create_all(con, tables=[Instrument.__table__, Stock.__table__, Alert.__table__])
+
+        # 1. One instrument per symbol. Every holding of a symbol was written
+        #    by the same UPDATE, so the latest row carries the live quote.
+        con.execute(text("""
+            INSERT OR IGNORE INTO instrument (symbol, current_price, previous_close, last_updated)
+            SELECT symbol, current_price, previous_close, MAX(last_updated)
+            FROM stock_legacy GROUP BY symbol
+        """))
+        con.execute(text("""
+            INSERT OR IGNORE INTO instrument (symbol, current_price, previous_close)
+            SELECT DISTINCT symbol, 0.0, 0.0 FROM alert_legacy
+        """))
+
+        # 2. Re-point holdings and alerts by integer key (ids preserved)
+        con.execute(text("""
+            INSERT INTO stock (id, instrument_id, quantity, buy_price, user_id)
+            SELECT s.id, i.id, s.quantity, s.buy_price, s.user_id
+            FROM stock_legacy s JOIN instrument i ON i.symbol = s.symbol
+        """))
+        con.execute(text("""
+            INSERT INTO alert (id, instrument_id, target_price, condition, is_active, last_triggered, user_id)
+            SELECT a.id, i.id, a.target_price, a.condition, a.is_active, a.last_triggered, a.user_id
+            FROM alert_legacy a JOIN instrument i ON i.symbol = a.symbol
+        """))
+
+        con.execute(text("DROP TABLE stock_legacy"))
+        con.execute(text("DROP TABLE alert_legacy"))
+
+    print("--- ✅ Migration complete ---")
+    return True
+
+def seed_instruments(market_list):
+    """Adds any master-list symbol (from fetch_nifty.py) missing from `instrument`."""
+    if not market_list:
+        return 0
+    rows = [{'symbol': s['symbol'], 'name': s.get('name')} for s in market_list if s.get('symbol')]
+    with db.engine.begin() as con:
+        result = con.execute(text("""
+            INSERT OR IGNORE INTO instrument (symbol, name, current_price, previous_close)
+            VALUES (:symbol, :name, 0.0, 0.0)
+        """), rows)
+    return result.rowcount
+
+if __name__ == "__main__":
+    # Importing the app runs its startup, which already calls the migration
+    import app
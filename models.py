@@ -13,24 +13,48 @@ class User(UserMixin, db.Model):
     stocks = db.relationship('Stock', backref='owner', lazy=True)
     alerts = db.relationship('Alert', backref='owner', lazy=True)
 
+class Instrument(db.Model):
+    """One row per tradable symbol. Holds the LIVE quote state shared by every holding/alert."""
+    id = db.Column(db.Integer, primary_key=True)
+    symbol = db.Column(db.String(20), unique=True, nullable=False)
+    name = db.Column(db.String(150), nullable=True)
+    
+    # PRICES (Written once per symbol per tick by monitor.py)
+    current_price = db.Column(db.Float, default=0.0)
+    previous_close = db.Column(db.Float, default=0.0) # For Daily P&L
+    
+    last_updated = db.Column(db.DateTime, nullable=True)
+    holdings = db.relationship('Stock', backref='instrument', lazy=True)
+    alerts = db.relationship('Alert', backref='instrument', lazy=True)
+
 class Stock(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    symbol = db.Column(db.String(20), nullable=False)
+    instrument_id = db.Column(db.Integer, db.ForeignKey('instrument.id'), nullable=False, index=True)
     quantity = db.Column(db.Float, nullable=False)
     buy_price = db.Column(db.Float, nullable=False)
-    
-    # PRICES
-    current_price = db.Column(db.Float, default=0.0) 
-    previous_close = db.Column(db.Float, default=0.0) # <--- NEW: For Daily P&L
-    
-    last_updated = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
 class Alert(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    symbol = db.Column(db.String(20), nullable=False)
+    instrument_id = db.Column(db.Integer, db.ForeignKey('instrument.id'), nullable=False, index=True)
     target_price = db.Column(db.Float, nullable=False)
     condition = db.Column(db.String(10), nullable=False)
     is_active = db.Column(db.Boolean, default=True)
     last_triggered = db.Column(db.DateTime, nullable=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
\ No newline at end of file
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    triggers = db.relationship('AlertTrigger', backref='alert', lazy=True)
+
+class AlertTrigger(db.Model):
+    """One row per alert that actually fired (written by monitor.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    alert_id = db.Column(db.Integer, db.ForeignKey('alert.id'), nullable=False, index=True)
+    price = db.Column(db.Float, nullable=False)
+    triggered_at = db.Column(db.DateTime, nullable=False)
+
+class PriceHistory(db.Model):
+    """Daily close per instrument. monitor.py upserts today's bar every tick."""
+    __table_args__ = (db.UniqueConstraint('instrument_id', 'day'),)
+    id = db.Column(db.Integer, primary_key=True)
+    instrument_id = db.Column(db.Integer, db.ForeignKey('instrument.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    close = db.Column(db.Float, nullable=False)
@@ -5,6 +5,8 @@ import requests
 import yfinance as yf
 from datetime import datetime, timedelta, timezone, time as dt_time
 import pandas as pd
+from upstream import NoDataError, UpstreamError, YAHOO_DOWNLOAD
+from maintenance import configure, run_maintenance
 
 # --- CONFIGURATION ---
 DB_PATH = "instance/database.db"
@@ -15,6 +17,7 @@ TEST_MODE = False
 MARKET_OPEN = dt_time(9, 15)
 MARKET_CLOSE = dt_time(15, 30)
 COOLDOWN_SECONDS = 120 
+MAINTENANCE_RETRY_SECONDS = 600 # Wait between retries if the checkpoint was blocked
 
 def get_ist_time():
     return datetime.now(timezone.utc) + timedelta(hours=5, minutes=30)
@@ -25,9 +28,21 @@ def send_telegram_msg(chat_id, message):
         requests.post(url, json={"chat_id": chat_id, "text": message}, timeout=10)
     except: pass
 
+def download_quotes(symbols):
+    # FETCH 5 DAYS (To safely get previous close)
+    # We need >1 day to know yesterday's close
+    data = yf.download(symbols, period="5d", interval="1d", progress=False)
+    if data.empty:
+        # Also what a lone mistyped holding looks like, so it must not trip the breaker
+        raise NoDataError(f"no data for {symbols}")
+    return data
+
 def update_prices_and_alerts():
     conn = sqlite3.connect(DB_PATH)
+    configure(conn)
     cursor = conn.cursor()
+    last_maintenance = None # IST date of the last CLEAN DB maintenance run
+    next_maintenance_try = 0
     print(f"--- 🧘 Narad Muni Started (Tracking Daily Change) ---")
     
     while True:
@@ -40,19 +55,39 @@ def update_prices_and_alerts():
                 current_time = now_ist.time()
                 market_is_open = (not is_weekend) and (MARKET_OPEN <= current_time <= MARKET_CLOSE)
 
-            cursor.execute("SELECT COUNT(*) FROM stock WHERE current_price = 0")
+            # --- DB MAINTENANCE (Once a day, after the close / on weekends) ---
+            after_hours = now_ist.weekday() >= 5 or now_ist.time() > MARKET_CLOSE
+            if (not market_is_open and after_hours and last_maintenance != now_ist.date()
+                    and time.time() >= next_maintenance_try):
+                try:
+                    report = run_maintenance(conn, DB_PATH)
+                    # busy=1: a reader (e.g. a long export) pinned the WAL, so it
+                    # wasn't truncated. Only a clean checkpoint counts for today.
+                    if report['checkpoint_busy'] == 0:
+                        last_maintenance = now_ist.date()
+                except Exception as e:
+                    print(f"\n⚠️ Maintenance Error: {e}")
+                if last_maintenance != now_ist.date():
+                    next_maintenance_try = time.time() + MAINTENANCE_RETRY_SECONDS
+
+            # Only instruments someone actually holds are tracked
+            cursor.execute("""
+                SELECT COUNT(*) FROM instrument i
+                WHERE i.current_price = 0 AND i.id IN (SELECT instrument_id FROM stock)
+            """)
             missing_data_count = cursor.fetchone()[0]
             should_fetch = market_is_open or (missing_data_count > 0)
 
             if should_fetch:
-                cursor.execute("SELECT DISTINCT symbol FROM stock")
-                symbols = [row[0] for row in cursor.fetchall()]
+                cursor.execute("SELECT i.id, i.symbol FROM instrument i WHERE i.id IN (SELECT instrument_id FROM stock)")
+                instrument_ids = {sym: i_id for i_id, sym in cursor.fetchall()}
+                symbols = list(instrument_ids)
                 
                 if symbols:
                     try:
-                        # FETCH 5 DAYS (To safely get previous close)
-                        # We need >1 day to know yesterday's close
-                        data = yf.download(symbols, period="5d", interval="1d", progress=False)
+                        # Breaker + rate limit: while Yahoo is struggling we skip ticks
+                        # (with growing, jittered cool downs) instead of hammering it
+                        data = YAHOO_DOWNLOAD.call(download_quotes, symbols)
                         
                         # We also fetch live price separately for precision if needed, 
                         # but '1d' interval data['Close'][-1] is usually current price.
@@ -61,6 +96,7 @@ def update_prices_and_alerts():
                         
                         prev_closes = {}
                         current_prices = {}
+                        bar_days = {} # Trading day of the latest bar (for price_history)
 
                         # Extract Data
                         if len(symbols) == 1:
@@ -70,6 +106,7 @@ def update_prices_and_alerts():
                                 if not df.empty:
                                     # Current Price = Last Row Close
                                     current_prices[symbols[0]] = df['Close'].iloc[-1].item()
+                                    bar_days[symbols[0]] = df.index[-1].date()
                                     # Prev Close = Second Last Row Close (if exists)
                                     if len(df) >= 2:
                                         prev_closes[symbols[0]] = df['Close'].iloc[-2].item()
@@ -83,6 +120,7 @@ def update_prices_and_alerts():
                                     series = data['Close'][sym].dropna()
                                     if not series.empty:
                                         current_prices[sym] = series.iloc[-1]
+                                        bar_days[sym] = series.index[-1].date()
                                         if len(series) >= 2:
                                             prev_closes[sym] = series.iloc[-2]
                                         else:
@@ -93,17 +131,27 @@ def update_prices_and_alerts():
                         alert_count = 0
                         for sym, price in current_prices.items():
                             p_close = prev_closes.get(sym, price) # Default to current if missing
+                            i_id = instrument_ids[sym]
                             
-                            cursor.execute("UPDATE stock SET current_price = ?, previous_close = ?, last_updated = ? WHERE symbol = ?", 
-                                           (float(price), float(p_close), datetime.now(), sym))
+                            # ONE quote write per symbol, shared by every holding
+                            cursor.execute("UPDATE instrument SET current_price = ?, previous_close = ?, last_updated = ? WHERE id = ?", 
+                                           (float(price), float(p_close), datetime.now(), i_id))
+                            # Daily bar: only written when the close actually moved
+                            # (a new day, or a new price), not on every tick
+                            if sym in bar_days:
+                                cursor.execute("""
+                                    INSERT INTO price_history (instrument_id, day, close) VALUES (?, ?, ?)
+                                    ON CONFLICT (instrument_id, day) DO UPDATE SET close = excluded.close
+                                    WHERE price_history.close IS NOT excluded.close
+                                """, (i_id, bar_days[sym].isoformat(), float(price)))
                             
                             # --- ALERTS (Same as before) ---
                             cursor.execute("""
                                 SELECT a.id, a.target_price, a.condition, a.last_triggered, u.telegram_chat_id 
                                 FROM alert a
                                 JOIN user u ON a.user_id = u.id
-                                WHERE a.symbol = ? AND a.is_active = 1 AND u.telegram_chat_id IS NOT NULL
-                            """, (sym,))
+                                WHERE a.instrument_id = ? AND a.is_active = 1 AND u.telegram_chat_id IS NOT NULL
+                            """, (i_id,))
                             
                             for alert in cursor.fetchall():
                                 a_id, target, cond, last_trig, chat_id = alert
@@ -121,12 +169,19 @@ def update_prices_and_alerts():
                                     if can_send:
                                         msg = f"Narayan... Narayan... 🙏\n\nPrabhu, {sym} is moving!\n✨ Price: ₹{price:.2f} (Target: {target})\n\nJay Ho! 🕉️"
                                         send_telegram_msg(chat_id, msg)
-                                        cursor.execute("UPDATE alert SET last_triggered = ? WHERE id = ?", (datetime.now(), a_id))
+                                        fired_at = datetime.now()
+                                        cursor.execute("UPDATE alert SET last_triggered = ? WHERE id = ?", (fired_at, a_id))
+                                        cursor.execute("INSERT INTO alert_trigger (alert_id, price, triggered_at) VALUES (?, ?, ?)",
+                                                       (a_id, float(price), fired_at))
                                         alert_count += 1
 
                         conn.commit()
                         print(f"✅ Live Update: {len(current_prices)} stocks. Alerts: {alert_count}", end='\r')
 
+                    except NoDataError as e:
+                        print(f"\n⚠️ Fetch Error: {e}")
+                    except UpstreamError as e:
+                        print(f"⏸️ Yahoo paused: {e}", end='\r')
                     except Exception as e:
                         print(f"\n⚠️ Fetch Error: {e}")
                 
@@ -0,0 +1,222 @@
+# upstream.py (SHARED CLIENT FOR YAHOO / GOOGLE)
+# ---------------------------------------------------------
+# Every call to an outside data source goes through an UpstreamClient:
+#   1. Token bucket   -> caps our request rate per endpoint
+#   2. Circuit breaker -> stops calling an endpoint that keeps failing
+#   3. Retries         -> exponential backoff with jitter
+# Only transport trouble (timeouts, dropped connections, 429, 5xx) is
+# retried or counted by the breaker. A bad ticker is the caller's problem
+# and must not cut Yahoo off for every other user.
+# StaleWhileRevalidate sits on top so routes get the last good value
+# instantly while ONE background refresh runs.
+# ---------------------------------------------------------
+import random
+import threading
+import time
+from concurrent.futures import Future
+import requests
+from curl_cffi.requests import exceptions as curl_exceptions
+from yfinance.exceptions import YFRateLimitError
+
+class UpstreamError(Exception):
+    """Base error for the upstream client (bad response or call refused)."""
+
+class CircuitOpenError(UpstreamError):
+    """Endpoint is failing; calls are short-circuited until it cools down."""
+
+class RateLimitedError(UpstreamError):
+    """Our own token bucket ran dry (we're protecting the upstream)."""
+
+class NoDataError(UpstreamError):
+    """Upstream answered but had nothing for these symbols (e.g. a mistyped
+    ticker). Not transient: retrying or tripping the breaker won't help."""
+
+# Raised by requests (Google RSS) and curl_cffi (yfinance) when the network
+# or the server lets us down
+TRANSIENT_ERRORS = (
+    TimeoutError, ConnectionError,
+    requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+    curl_exceptions.ConnectionError, curl_exceptions.Timeout,
+    YFRateLimitError,
+)
+
+def is_transient(exc):
+    """True for failures worth retrying: transport errors, HTTP 429 and 5xx."""
+    status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(exc, TRANSIENT_ERRORS)
+
+def backoff_delay(attempt, base, cap):
+    """Exponential backoff with full jitter: random(0, min(cap, base * 2^attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate # Tokens added per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, max_wait):
+        """Takes one token, waiting up to max_wait seconds. Returns False if none came."""
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_for = (1 - self.tokens) / self.rate
+            if now + wait_for > deadline:
+                return False
+            time.sleep(wait_for)
+
+class CircuitBreaker:
+    """CLOSED -> (N failures) -> OPEN -> (cool down) -> HALF_OPEN -> one probe call.
+    Each time the probe fails the cool down doubles (with jitter), up to max_reset."""
+    def __init__(self, failure_threshold, reset_timeout, max_reset):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset = max_reset
+        self.failures = 0
+        self.trips = 0 # Consecutive times we've opened
+        self.open_until = 0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.trips == 0:
+            return "CLOSED"
+        return "OPEN" if time.monotonic() < self.open_until else "HALF_OPEN"
+
+    def allow(self):
+        with self.lock:
+            if self.trips == 0:
+                return True
+            if time.monotonic() < self.open_until or self.probing:
+                return False
+            self.probing = True # Let exactly one caller test the water
+            return True
+
+    def release_probe(self):
+        with self.lock:
+            self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.trips = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.trips += 1
+                cool_down = min(self.max_reset, self.reset_timeout * (2 ** (self.trips - 1)))
+                self.open_until = time.monotonic() + cool_down * random.uniform(0.8, 1.2)
+                self.failures = 0
+                self.probing = False
+
+class UpstreamClient:
+    def __init__(self, name, rate, burst, failure_threshold=5, reset_timeout=15,
+                 max_reset=300, max_retries=2, base_delay=0.5, max_delay=4, max_wait=2):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, max_reset)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait # Longest we'll queue for a rate-limit token
+
+    def call(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) under this endpoint's limits. Transient
+        errors are retried and re-raised once retries are used up; any other
+        error is re-raised at once without touching the breaker."""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit open")
+        # One token per call: retries are already spaced out by the backoff
+        if not self.bucket.acquire(self.max_wait):
+            self.breaker.release_probe() # We never made the call
+            raise RateLimitedError(f"{self.name} rate limited")
+
+        attempt = 0
+        while True:
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.release_probe()
+                    raise
+                self.breaker.record_failure()
+                print(f"--- ⚠️ {self.name} attempt {attempt + 1} failed ({e}), breaker {self.breaker.state} ---")
+                if attempt >= self.max_retries or self.breaker.state != "CLOSED":
+                    raise
+                time.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+                attempt += 1
+            else:
+                self.breaker.record_success()
+                return result
+
+# ---------------------------------------------------------
+# STALE-WHILE-REVALIDATE CACHE
+# ---------------------------------------------------------
+class StaleWhileRevalidate:
+    """key -> last good value. Fresh values are served as-is; stale ones are
+    served immediately while one background refresh runs. Failed refreshes
+    keep the old value, so callers ride out upstream incidents."""
+    def __init__(self, loader, ttl, executor):
+        self.loader = loader
+        self.ttl = ttl
+        self.executor = executor
+        self.entries = {} # key -> (value, timestamp)
+        self.inflight = {} # key -> Future (dedups concurrent refreshes)
+        self.lock = threading.Lock()
+
+    def get_future(self, key):
+        """Returns a Future for key's value: already done on a hit (fresh or
+        stale), pending on a cold miss."""
+        entry = self.entries.get(key)
+        if entry:
+            if time.time() - entry[1] >= self.ttl:
+                self.refresh(key)
+            done = Future()
+            done.set_result(entry[0])
+            return done
+        return self.refresh(key)
+
+    def get(self, key, timeout):
+        """Blocking helper. Only a cold miss can wait (up to timeout)."""
+        return self.get_future(key).result(timeout=timeout)
+
+    def refresh(self, key):
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is None:
+                future = self.executor.submit(self._load, key)
+                self.inflight[key] = future
+            return future
+
+    def _load(self, key):
+        try:
+            value = self.loader(key)
+            self.entries[key] = (value, time.time())
+            return value
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+# ---------------------------------------------------------
+# ENDPOINTS (One breaker + bucket each)
+# ---------------------------------------------------------
+YAHOO_QUOTES = UpstreamClient('yahoo_quotes', rate=2, burst=5)
+YAHOO_NEWS = UpstreamClient('yahoo_news', rate=1, burst=3)
+GOOGLE_NEWS = UpstreamClient('google_news', rate=2, burst=5)
+# monitor.py: one bulk download per tick, so 1 token every 5s is plenty
+YAHOO_DOWNLOAD = UpstreamClient('yahoo_download', rate=0.2, burst=1, failure_threshold=3,
+                                reset_timeout=30, max_reset=600, max_retries=1, max_wait=0)